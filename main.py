@@ -14,8 +14,9 @@ import schemas
 import settings
 import tools
 import uploaders as up
-from database import create_all_tables, get_async_session
+from database import async_session_maker, create_all_tables, get_async_session
 from models import Review, review_columns
+from snapshot import ReviewSnapshot
 
 
 valid_column_names = Literal[tuple(review_columns)]
@@ -23,6 +24,12 @@ database_api_key_header = APIKeyHeader(name="Access-Token")
 sudo_tokens = config("SUDO_TOKENS", cast=Csv())
 user_tokens = config("USER_TOKENS", cast=Csv())
 
+# optional in-process filtering engine, see snapshot.ReviewSnapshot
+review_snapshot = (
+    ReviewSnapshot() if config("REVIEW_SNAPSHOT", default=False, cast=bool)
+    else None
+)
+
 
 class AccessTokenChecker:
     """
@@ -84,6 +91,12 @@ async def numbered_list(
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await create_all_tables()
+    if review_snapshot is not None:
+        async with async_session_maker() as session:
+            await review_snapshot.load(session)
+        logfire.info(
+            "review snapshot loaded", **review_snapshot.memory_report()
+        )
     yield
 
 
@@ -103,6 +116,8 @@ async def create_reviews(
     reviews = [Review(**review.model_dump()) for review in new_reviews]
     session.add_all(reviews)
     await session.commit()
+    if review_snapshot is not None:
+        review_snapshot.add(reviews)
     up.database_backup()
 
 
@@ -120,21 +135,33 @@ async def filter_reviews(
         "location": location,
         "product" : product
     }
-    clauses = [
-        getattr(Review, column_name).in_(query_param)
-        for column_name, query_param in column_param_mapping.items()
-        if query_param is not None
-    ]
 
     # date format is hardcoded as defined in helper API
     # https://utc-plus-minus-delta.containerapps.ru
     if startDate is not None:
         startDate = datetime.strptime(startDate, "%Y%m%d")
-        clauses += [Review.datePublished >= startDate]
 
-    statement = select(Review).where(*clauses).order_by(Review.datePublished)
-    result = await session.execute(statement)
-    scalars = result.scalars().all()
+    if review_snapshot is not None:
+        with logfire.span("review snapshot select_positions"):
+            positions = review_snapshot.select_positions(
+                column_param_mapping, startDate
+            )
+        with logfire.span("review snapshot fetch"):
+            scalars = await review_snapshot.fetch(session, positions)
+    else:
+        clauses = [
+            getattr(Review, column_name).in_(query_param)
+            for column_name, query_param in column_param_mapping.items()
+            if query_param is not None
+        ]
+        if startDate is not None:
+            clauses += [Review.datePublished >= startDate]
+
+        statement = (
+            select(Review).where(*clauses).order_by(Review.datePublished)
+        )
+        result = await session.execute(statement)
+        scalars = result.scalars().all()
     if not scalars:
         return {"agent_message": settings.NO_RESULT_SENTINEL}
 
@@ -207,6 +234,8 @@ async def update_review(
         setattr(review, key, value)
     session.add(review)
     await session.commit()
+    if review_snapshot is not None:
+        review_snapshot.update(review)
     up.database_backup()
     return review
 
@@ -223,4 +252,6 @@ async def delete_reviews(  # many at once
     statement = delete(Review).where(Review.id.in_(drop_ids))
     await session.execute(statement)
     await session.commit()
+    if review_snapshot is not None:
+        review_snapshot.remove(drop_ids)
     up.database_backup()
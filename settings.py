@@ -11,3 +11,6 @@ PLOT_MAX_ITEMS      : int = 3    # banks/products/locations
 PLOT_TOP_N          : int = 5    # banks
 PLOT_LABEL_MAXLEN   : int = 30   # characters
 S3_URL_LIFESPAN     : int = 180  # seconds
+
+# keep well below SQLite's limit on the number of host parameters
+SNAPSHOT_FETCH_BATCH_SIZE: int = 5000  # reviews
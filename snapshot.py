@@ -0,0 +1,287 @@
+import sys
+from collections.abc import Iterable
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import settings
+from models import Review
+
+
+class CategoryColumn:
+    """
+    Low-cardinality string column stored as integer category codes
+    with a per-value position index maintained on writes.
+
+    Positions of the rows holding code `c` are
+    `order[bounds[c]:bounds[c + 1]]`, sorted ascending, i.e. in
+    `datePublished` order.
+    """
+
+    def __init__(self, values: Iterable[str]) -> None:
+        codes, categories = pd.factorize(pd.Series(list(values), dtype=object))
+        self.categories: list[str] = list(categories)
+        self.lookup: dict[str, int] = {
+            value: code for code, value in enumerate(self.categories)
+        }
+        self.codes = codes.astype(np.int32)
+        self.order = np.argsort(self.codes, kind="stable").astype(np.int32)
+        self.reset_bounds()
+
+    def encode(self, values: Iterable[str]) -> np.ndarray:
+        """Category codes of the values, new categories are registered. """
+        codes = []
+        for value in values:
+            if value not in self.lookup:
+                self.lookup[value] = len(self.categories)
+                self.categories.append(value)
+            codes.append(self.lookup[value])
+        return np.array(codes, dtype=np.int32)
+
+    def reset_bounds(self) -> None:
+        counts = np.bincount(self.codes, minlength=len(self.categories))
+        self.bounds = np.concatenate(([0], np.cumsum(counts)))
+
+    def grow_bounds(self) -> None:
+        """Give newly registered categories empty postings at the end. """
+        n_missing = len(self.categories) + 1 - self.bounds.size
+        self.bounds = np.pad(self.bounds, (0, n_missing), mode="edge")
+
+    def wanted_codes(self, values: list[str]) -> list[int]:
+        """Codes of the values, unknown values match no rows. """
+        return [self.lookup[value] for value in values if value in self.lookup]
+
+    def count(self, codes: list[int]) -> int:
+        """Number of rows holding any of the codes. """
+        return int(sum(self.bounds[c + 1] - self.bounds[c] for c in codes))
+
+    def positions(self, codes: list[int], start: int = 0) -> np.ndarray:
+        """Sorted positions `>= start` of the rows holding any of codes. """
+        postings = []
+        for code in codes:
+            posting = self.order[self.bounds[code]:self.bounds[code + 1]]
+            postings.append(posting[np.searchsorted(posting, start):])
+        if len(postings) == 1:
+            return postings[0]
+        return np.sort(np.concatenate(postings or [self.order[:0]]))
+
+    def lookup_table(self, codes: list[int]) -> np.ndarray:
+        """Boolean table indexed by code, `True` for the given codes. """
+        table = np.zeros(len(self.categories), dtype=bool)
+        table[codes] = True
+        return table
+
+    def insert(self, where: np.ndarray, values: list[str]) -> None:
+        """
+        Insert rows before the positions `where` (sorted, `np.insert`
+        semantics) shifting the existing postings.
+        """
+        new_codes = self.encode(values)
+        new_positions = (where + np.arange(where.size)).astype(np.int32)
+        # every old position moves by the number of rows inserted before it
+        self.order += np.searchsorted(where, self.order, side="right").astype(
+            np.int32
+        )
+        self.grow_bounds()
+        # equal slots keep the given order, hence (code, position) sorting
+        by_code = np.lexsort((new_positions, new_codes))
+        slots = np.array([
+            self.bounds[code] + np.searchsorted(
+                self.order[self.bounds[code]:self.bounds[code + 1]], position
+            )
+            for code, position in zip(
+                new_codes[by_code], new_positions[by_code]
+            )
+        ], dtype=np.int64)
+        self.order = np.insert(self.order, slots, new_positions[by_code])
+        self.codes = np.insert(self.codes, where, new_codes)
+        self.reset_bounds()
+
+    def delete(self, keep: np.ndarray) -> None:
+        """Drop the rows not marked in `keep` renumbering the postings. """
+        new_positions = (np.cumsum(keep) - 1).astype(np.int32)
+        order = self.order[keep[self.order]]
+        self.order = new_positions[order]
+        self.codes = self.codes[keep]
+        self.reset_bounds()
+
+    def set(self, position: int, value: str) -> None:
+        """Move the row at `position` to the posting of the new value. """
+        new_code, old_code = self.encode([value])[0], self.codes[position]
+        if new_code == old_code:
+            return
+        old_slot = self.bounds[old_code] + np.searchsorted(
+            self.order[self.bounds[old_code]:self.bounds[old_code + 1]],
+            position
+        )
+        self.order = np.delete(self.order, old_slot)
+        self.codes[position] = new_code
+        self.grow_bounds()
+        self.bounds[old_code + 1:] -= 1
+        new_slot = self.bounds[new_code] + np.searchsorted(
+            self.order[self.bounds[new_code]:self.bounds[new_code + 1]],
+            position
+        )
+        self.order = np.insert(self.order, new_slot, position)
+        self.bounds[new_code + 1:] += 1
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.codes.nbytes
+            + self.order.nbytes
+            + self.bounds.nbytes
+            + sys.getsizeof(self.categories)
+            + sum(map(sys.getsizeof, self.categories))
+            + sys.getsizeof(self.lookup)
+        )
+
+
+class ReviewSnapshot:
+    """
+    In-memory columnar snapshot of the `reviews` table for filtering.
+
+    Rows are kept sorted by `datePublished`, so the date predicate is
+    a binary search and the result positions come out in report order.
+    `reviewBody` and `url` aren't kept: only the selected rows are
+    fetched from the database for the report.
+    """
+
+    category_column_names = ["bankName", "location", "product"]
+
+    def __init__(self) -> None:
+        self.ids = np.empty(0, dtype=np.int64)
+        self.dates = np.empty(0, dtype="datetime64[us]")
+        self.columns = {
+            column_name: CategoryColumn([])
+            for column_name in self.__class__.category_column_names
+        }
+
+    def __len__(self) -> int:
+        return self.ids.size
+
+    async def load(self, session: AsyncSession) -> None:
+        """Build the snapshot from scratch. """
+        column_names = ["id", "datePublished", *self.columns]
+        statement = (
+            select(*(getattr(Review, name) for name in column_names))
+            .order_by(Review.datePublished, Review.id)
+        )
+        result = await session.execute(statement)
+        data = pd.DataFrame(result.all(), columns=column_names)
+        self.ids = data["id"].to_numpy(dtype=np.int64)
+        self.dates = data["datePublished"].to_numpy(dtype="datetime64[us]")
+        self.columns = {
+            column_name: CategoryColumn(data[column_name])
+            for column_name in self.columns
+        }
+
+    def add(self, reviews: list[Review]) -> None:
+        """Insert committed reviews keeping the date order. """
+        if not reviews:
+            return
+        ids = np.array([review.id for review in reviews], dtype=np.int64)
+        dates = pd.to_datetime(
+            [review.datePublished for review in reviews]
+        ).to_numpy(dtype="datetime64[us]")
+        order = np.lexsort((ids, dates))
+        ids, dates = ids[order], dates[order]
+        # keep (datePublished, id) order: date ties are broken by id
+        where = np.searchsorted(self.dates, dates, side="left")
+        right = np.searchsorted(self.dates, dates, side="right")
+        for i in np.flatnonzero(where != right):
+            where[i] += np.searchsorted(self.ids[where[i]:right[i]], ids[i])
+        self.ids = np.insert(self.ids, where, ids)
+        self.dates = np.insert(self.dates, where, dates)
+        for column_name, column in self.columns.items():
+            column.insert(
+                where, [getattr(reviews[i], column_name) for i in order]
+            )
+
+    def update(self, review: Review) -> None:
+        """
+        Refresh the patched review. A changed `datePublished` (sort key)
+        re-positions the row, otherwise categorical codes are patched
+        in place.
+        """
+        positions = np.flatnonzero(self.ids == review.id)
+        date = pd.Timestamp(review.datePublished).to_datetime64()
+        if (self.dates[positions] != date).any():
+            self.remove([review.id])
+            self.add([review])
+            return
+        for position in positions:
+            for column_name, column in self.columns.items():
+                column.set(position, getattr(review, column_name))
+
+    def remove(self, drop_ids: list[int]) -> None:
+        keep = ~np.isin(self.ids, drop_ids)
+        self.ids = self.ids[keep]
+        self.dates = self.dates[keep]
+        for column in self.columns.values():
+            column.delete(keep)
+
+    def select_positions(
+        self,
+        column_param_mapping: dict[str, list[str] | None],
+        start_date: datetime | None = None
+    ) -> np.ndarray:
+        """Row positions matching the filter, in `datePublished` order. """
+        start = 0
+        if start_date is not None:
+            start = int(np.searchsorted(
+                self.dates, np.datetime64(start_date, "us"), side="left"
+            ))
+        filters = [
+            (column, column.wanted_codes(query_param))
+            for column_name, query_param in column_param_mapping.items()
+            if query_param is not None
+            for column in [self.columns[column_name]]
+        ]
+        if not filters:
+            return np.arange(start, len(self), dtype=np.int32)
+
+        # postings of the most selective column, the rest is checked
+        # by code lookup on these candidates only
+        filters.sort(key=lambda f: f[0].count(f[1]))
+        (column, codes), *others = filters
+        positions = column.positions(codes, start)
+        for column, codes in others:
+            if not positions.size:
+                break
+            table = column.lookup_table(codes)
+            positions = positions[table[column.codes[positions]]]
+        return positions
+
+    async def fetch(
+        self, session: AsyncSession, positions: np.ndarray
+    ) -> list[Review]:
+        """Fetch the selected rows from the database in batches. """
+        ids = self.ids[positions].tolist()
+        batch_size = settings.SNAPSHOT_FETCH_BATCH_SIZE
+        scalars = []
+        # batches are date ordered, hence so is the concatenation
+        for offset in range(0, len(ids), batch_size):
+            statement = (
+                select(Review)
+                .where(Review.id.in_(ids[offset:offset + batch_size]))
+                .order_by(Review.datePublished, Review.id)
+            )
+            result = await session.execute(statement)
+            scalars.extend(result.scalars().all())
+        return scalars
+
+    def memory_report(self) -> dict[str, int | float]:
+        """Memory footprint, total and per million reviews. """
+        nbytes = self.ids.nbytes + self.dates.nbytes + sum(
+            column.nbytes for column in self.columns.values()
+        )
+        per_million = nbytes / len(self) * 1_000_000 if len(self) else 0.0
+        return {
+            "n_reviews"             : len(self),
+            "nbytes"                : nbytes,
+            "mb_per_million_reviews": round(per_million / 2 ** 20, 2)
+        }